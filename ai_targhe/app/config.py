@@ -5,6 +5,39 @@ import logging
 import os
 
 OPTIONS_PATH = "/data/options.json"
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+# Upper-cases ASCII and deletes separators in a single translate() pass
+_PLATE_TABLE = str.maketrans(
+    "abcdefghijklmnopqrstuvwxyz",
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+    " -\t\n\r",
+)
+
+
+def normalize_plate(text: str) -> str:
+    """Normalize plate text: upper-case, no spaces or dashes ('ab 123-cd' -> 'AB123CD')."""
+    return text.translate(_PLATE_TABLE)
+
+
+def available_cpus() -> int:
+    """CPUs this container may use: the cgroup v2 CPU quota if set, else the affinity mask.
+
+    os.cpu_count() reports the host cores, which oversubscribes thread pools
+    when the Supervisor limits the add-on's CPU.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, -(-int(quota) // int(period)))  # ceil
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
 
 
 class AddonConfig:
@@ -22,10 +55,9 @@ class AddonConfig:
 
         self.camera_entity: str = opts["camera_entity"]
         self.scan_interval: int = opts.get("scan_interval", 5)
-        self.target_plates: list[str] = [
-            p.upper().replace(" ", "").replace("-", "")
-            for p in opts.get("target_plates", [])
-        ]
+        self.target_plates: frozenset[str] = frozenset(
+            normalize_plate(p) for p in opts.get("target_plates", [])
+        )
         self.confidence_threshold: float = opts.get("confidence_threshold", 0.5)
         self.target_detected_timeout: int = opts.get("target_detected_timeout", 30)
         self.log_level: str = opts.get("log_level", "info").upper()
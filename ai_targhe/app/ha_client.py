@@ -4,13 +4,50 @@ import logging
 import os
 import re
 import time
+from datetime import datetime
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
 SUPERVISOR_URL = "http://supervisor/core/api"
 
+# MJPEG read size: one call per ~socket buffer instead of per 8 KiB
+STREAM_CHUNK_SIZE = 65536
+
+_BOUNDARY_RE = re.compile(r"boundary=(\S+)", re.IGNORECASE)
+_CONTENT_LENGTH_RE = re.compile(rb"(?im)^content-length:\s*(\d+)\s*$")
+
+# Max seconds a repeated plate is suppressed before it is re-reported
+REPORT_DEBOUNCE_MAX = 15
+
+# Static sensor attributes, built once; dynamic fields are merged per report.
+LAST_PLATE_ATTRS = {
+    "friendly_name": "AI Targhe - Ultima Targa",
+    "icon": "mdi:car",
+}
+TARGET_ON_ATTRS = {
+    "friendly_name": "AI Targhe - Targa Autorizzata",
+    "device_class": "occupancy",
+    "icon": "mdi:car-connected",
+}
+TARGET_OFF_ATTRS = {
+    "friendly_name": "AI Targhe - Targa Autorizzata",
+    "device_class": "occupancy",
+    "icon": "mdi:car-off",
+}
+
+
+def _dumps(payload: dict) -> bytes:
+    """Serialize a request body with orjson (bytes out, numpy scalars allowed).
+
+    The session already sends Content-Type: application/json.
+    """
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
 
 def _first_jpeg_from_mjpeg_stream(stream, timeout: float = 20.0) -> bytes | None:
     """Read the first JPEG frame from an MJPEG (multipart) stream.
@@ -20,7 +57,7 @@ def _first_jpeg_from_mjpeg_stream(stream, timeout: float = 20.0) -> bytes | None
     """
     deadline = time.monotonic() + timeout
     content_type = stream.headers.get("Content-Type", "")
-    boundary_match = re.search(r"boundary=(\S+)", content_type)
+    boundary_match = _BOUNDARY_RE.search(content_type)
     if not boundary_match:
         logger.debug("No boundary in MJPEG Content-Type: %s", content_type)
         return None
@@ -28,42 +65,44 @@ def _first_jpeg_from_mjpeg_stream(stream, timeout: float = 20.0) -> bytes | None
     if not boundary.startswith(b"--"):
         boundary = b"--" + boundary
 
-    buf = b""
+    # bytearray grows in amortized O(1); the body is located by offset
+    # instead of re-slicing the buffer after the part headers.
+    buf = bytearray()
     state = "find_boundary"
     content_length = 0
+    body_start = 0
 
-    for chunk in stream.iter_content(chunk_size=8192):
+    for chunk in stream.iter_content(chunk_size=STREAM_CHUNK_SIZE):
         if time.monotonic() > deadline:
             logger.warning("Timeout reading first frame from MJPEG stream")
             return None
         if not chunk:
             continue
-        buf += chunk
+        # Resume the header search just before the new data, in case
+        # "\r\n\r\n" is split across two chunks
+        scan_from = max(0, len(buf) - 3)
+        buf.extend(chunk)
 
         if state == "find_boundary":
-            idx = buf.find(b"\r\n\r\n")
+            idx = buf.find(b"\r\n\r\n", scan_from)
             if idx == -1:
-                if len(buf) > 8192:
-                    buf = buf[-2048:]
+                if len(buf) > STREAM_CHUNK_SIZE:
+                    del buf[:-2048]
                 continue
-            headers_block = buf[:idx]
-            buf = buf[idx + 4:]
+            body_start = idx + 4
             state = "body"
-            for line in headers_block.split(b"\r\n"):
-                if line.lower().startswith(b"content-length:"):
-                    try:
-                        content_length = int(line.split(b":", 1)[1].strip())
-                    except (ValueError, IndexError):
-                        pass
-                    break
+            # Scan the part headers in place (no copy/split/lower per line)
+            length_match = _CONTENT_LENGTH_RE.search(buf, 0, idx)
+            if length_match:
+                content_length = int(length_match.group(1))
             if content_length <= 0:
                 logger.debug("No Content-Length in MJPEG part headers")
                 return None
 
         if state == "body":
-            if len(buf) >= content_length:
-                return buf[:content_length]
-            if len(buf) > 2 * 1024 * 1024:
+            if len(buf) - body_start >= content_length:
+                return bytes(buf[body_start:body_start + content_length])
+            if len(buf) - body_start > 2 * 1024 * 1024:
                 logger.warning("MJPEG part too large, aborting")
                 return None
 
@@ -85,6 +124,30 @@ class HAClient:
             "Content-Type": "application/json",
         }
         self._target_off_at: float = 0.0
+        self._target_plate: str | None = None
+        self._last_plates: frozenset[str] = frozenset()
+        self._last_plates_at: float = 0.0
+
+        # Persistent session: reuse TCP connections to the Supervisor instead
+        # of opening a new one for every request of the scan loop.
+        # raise_on_status=False: once retries are exhausted the 5xx response
+        # still reaches raise_for_status(), so the MJPEG fallback keeps working.
+        self._session = requests.Session()
+        self._session.headers.update(self.headers)
+        retry = Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        )
+        self._session.mount(
+            "http://",
+            HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry),
+        )
+
+    def close(self):
+        """Close the underlying HTTP session and its pooled connections."""
+        self._session.close()
 
     # --- Low-level API methods ---
 
@@ -102,12 +165,12 @@ class HAClient:
         """
         # 1) Try still-image proxy (works when camera has native snapshot)
         url_still = f"{SUPERVISOR_URL}/camera_proxy/{entity_id}"
-        req_headers = {
-            **self.headers,
-            "Accept": "image/jpeg, image/*, */*",
-        }
         try:
-            resp = requests.get(url_still, headers=req_headers, timeout=15)
+            resp = self._session.get(
+                url_still,
+                headers={"Accept": "image/jpeg, image/*, */*"},
+                timeout=15,
+            )
             resp.raise_for_status()
             return resp.content
         except requests.RequestException as e:
@@ -144,9 +207,9 @@ class HAClient:
         """Get one JPEG frame from camera_proxy_stream (for stream-only cameras)."""
         url = f"{SUPERVISOR_URL}/camera_proxy_stream/{entity_id}"
         try:
-            resp = requests.get(
+            resp = self._session.get(
                 url,
-                headers={**self.headers, "Accept": "multipart/x-mixed-replace, */*"},
+                headers={"Accept": "multipart/x-mixed-replace, */*"},
                 stream=True,
                 timeout=25,
             )
@@ -165,9 +228,7 @@ class HAClient:
             "attributes": attributes or {},
         }
         try:
-            resp = requests.post(
-                url, json=payload, headers=self.headers, timeout=10
-            )
+            resp = self._session.post(url, data=_dumps(payload), timeout=10)
             resp.raise_for_status()
             logger.debug("Updated %s = %s", entity_id, state)
         except requests.RequestException as e:
@@ -177,9 +238,7 @@ class HAClient:
         """Fire an event in Home Assistant."""
         url = f"{SUPERVISOR_URL}/events/{event_type}"
         try:
-            resp = requests.post(
-                url, json=event_data, headers=self.headers, timeout=10
-            )
+            resp = self._session.post(url, data=_dumps(event_data), timeout=10)
             resp.raise_for_status()
             logger.debug("Fired event %s", event_type)
         except requests.RequestException as e:
@@ -192,69 +251,112 @@ class HAClient:
         self.update_sensor(
             "sensor.ai_targhe_last_plate",
             state="unknown",
-            attributes={
-                "friendly_name": "AI Targhe - Ultima Targa",
-                "icon": "mdi:car",
-            },
+            attributes=LAST_PLATE_ATTRS,
         )
         self.update_sensor(
             "binary_sensor.ai_targhe_target_detected",
             state="off",
-            attributes={
-                "friendly_name": "AI Targhe - Targa Autorizzata",
-                "device_class": "occupancy",
-                "icon": "mdi:car-off",
-            },
+            attributes=TARGET_OFF_ATTRS,
         )
 
     def report_plate(self, plate: str, confidence: float,
-                     is_target: bool, target_timeout: int):
-        """Report a detected plate: update sensors and fire event."""
+                     is_target: bool, target_timeout: int,
+                     seen_at: str | None = None, force: bool = False):
+        """Report a single detected plate (see report_plates)."""
+        self.report_plates(
+            [{"plate": plate, "confidence": confidence, "is_target": is_target}],
+            target_timeout,
+            seen_at=seen_at,
+            force=force,
+        )
+
+    def report_plates(self, plates: list[dict], target_timeout: int,
+                      seen_at: str | None = None, force: bool = False):
+        """Report the plates read in one scan: update sensors and fire one event.
+
+        The last-plate sensor gets the highest-confidence plate, the
+        binary_sensor the best target plate (if any), and a single
+        ai_targhe_plate_detected event carries the best target plate (else
+        the best plate) plus the full list under "plates". The same set of
+        plates seen again within min(target_timeout, 15s) of its last report
+        is not re-sent; only the target timeout is extended.
+
+        Args:
+            plates: [{"plate", "confidence" (0-1), "is_target"}, ...]
+            seen_at: ISO timestamp of the scan; computed here if not given.
+            force: Report even if the same plates were just reported.
+        """
+        if not plates:
+            return
+        now = time.time()
+        targets = [p for p in plates if p["is_target"]]
+        plate_set = frozenset(p["plate"] for p in plates)
+        debounce = min(target_timeout, REPORT_DEBOUNCE_MAX)
+        if (not force and plate_set == self._last_plates
+                and now - self._last_plates_at < debounce):
+            if targets:
+                self._target_off_at = now + target_timeout
+            logger.debug("Plates %s already reported, skipping", sorted(plate_set))
+            return
+        self._last_plates = plate_set
+        self._last_plates_at = now
+
+        if seen_at is None:
+            seen_at = datetime.now().isoformat(timespec="seconds")
+        best = max(plates, key=lambda p: p["confidence"])
+        best_target = max(targets, key=lambda p: p["confidence"]) if targets else None
+
         # 1. Update last plate sensor
         self.update_sensor(
             "sensor.ai_targhe_last_plate",
-            state=plate,
+            state=best["plate"],
             attributes={
-                "friendly_name": "AI Targhe - Ultima Targa",
-                "confidence": round(confidence * 100, 1),
-                "is_target": is_target,
-                "icon": "mdi:car",
-                "last_seen": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                **LAST_PLATE_ATTRS,
+                "confidence": round(best["confidence"] * 100, 1),
+                "is_target": best["is_target"],
+                "last_seen": seen_at,
             },
         )
 
-        # 2. Update binary_sensor if it's a target plate
-        if is_target:
-            self._target_off_at = time.time() + target_timeout
-            self.update_sensor(
-                "binary_sensor.ai_targhe_target_detected",
-                state="on",
-                attributes={
-                    "friendly_name": "AI Targhe - Targa Autorizzata",
-                    "device_class": "occupancy",
-                    "plate": plate,
-                    "icon": "mdi:car-connected",
-                },
-            )
+        # 2. Update binary_sensor if a target plate is present (only on
+        # OFF -> ON or when a different target plate shows up)
+        if targets:
+            self._target_off_at = now + target_timeout
+            target = best_target["plate"]
+            if target != self._target_plate or force:
+                self._target_plate = target
+                self.update_sensor(
+                    "binary_sensor.ai_targhe_target_detected",
+                    state="on",
+                    attributes={**TARGET_ON_ATTRS, "plate": target},
+                )
 
-        # 3. Fire event (for any valid plate)
+        # 3. Fire one event for the whole scan. The top-level fields describe
+        # the best target plate when there is one, so automations matching
+        # is_target: true still fire when a non-target plate reads better.
+        headline = best_target or best
         self.fire_event("ai_targhe_plate_detected", {
-            "plate": plate,
-            "confidence": round(confidence * 100, 1),
-            "is_target": is_target,
+            "plate": headline["plate"],
+            "confidence": round(headline["confidence"] * 100, 1),
+            "is_target": headline["is_target"],
+            "plates": [
+                {
+                    "plate": p["plate"],
+                    "confidence": round(p["confidence"] * 100, 1),
+                    "is_target": p["is_target"],
+                }
+                for p in plates
+            ],
         })
 
     def check_target_timeout(self):
         """Turn OFF binary_sensor if target timeout has expired."""
         if self._target_off_at > 0 and time.time() > self._target_off_at:
             self._target_off_at = 0.0
+            self._target_plate = None
             self.update_sensor(
                 "binary_sensor.ai_targhe_target_detected",
                 state="off",
-                attributes={
-                    "friendly_name": "AI Targhe - Targa Autorizzata",
-                    "device_class": "occupancy",
-                    "icon": "mdi:car-off",
-                },
+                attributes=TARGET_OFF_ATTRS,
             )
             logger.info("Target detection timeout expired, binary_sensor -> OFF")
@@ -1,35 +1,81 @@
 """AI Targhe - Main add-on loop for Home Assistant."""
 
 import logging
+import os
+import queue
 import signal
+import sys
+import threading
 import time
+from datetime import datetime
 
-import cv2
-import numpy as np
+from config import AddonConfig, available_cpus
 
-from config import AddonConfig
-from ha_client import HAClient
-from plate_recognizer import PlateRecognizer
+# Size the native thread pools (OpenMP/BLAS) to the container's CPU quota.
+# Must run before cv2/numpy/tesserocr are imported: they read these at load time.
+CPU_THREADS = available_cpus()
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, str(CPU_THREADS))
+# Tesseract's OpenMP threading costs more than it gains on a single text
+# line; plate_recognizer runs the OCR variants in parallel on a thread pool
+# instead. OMP_THREAD_LIMIT is process-wide: it caps EVERY OpenMP user loaded
+# in this process (libtesseract, and OpenCV/BLAS if built with OpenMP) at one
+# thread, overriding OMP_NUM_THREADS above. The pools that matter here are
+# sized independently: OpenCV's own (cv2.setNumThreads below, pthreads in the
+# wheels), ONNX Runtime's intra-op pool and the OCR pool. The tesseract CLI
+# (pytesseract fallback) inherits it.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+import cv2  # noqa: E402
+
+from ha_client import HAClient  # noqa: E402
+from plate_recognizer import PlateRecognizer  # noqa: E402
+
+cv2.setNumThreads(CPU_THREADS)
 
 # --- Graceful shutdown ---
-running = True
+_stop = threading.Event()
 
 
 def _shutdown(signum, _frame):
-    global running
     logging.info("Received signal %s, shutting down...", signum)
-    running = False
+    _stop.set()
 
 
 signal.signal(signal.SIGTERM, _shutdown)
 signal.signal(signal.SIGINT, _shutdown)
 
 
-def jpeg_to_frame(jpeg_bytes: bytes) -> np.ndarray | None:
-    """Convert JPEG bytes from HA camera API to OpenCV BGR frame."""
-    arr = np.frombuffer(jpeg_bytes, dtype=np.uint8)
-    frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-    return frame
+def _snapshot_producer(ha: HAClient, entity_id: str, interval: int,
+                       frames: queue.Queue):
+    """Fetch a snapshot every `interval` seconds into a 1-slot queue.
+
+    Runs on its own thread so HTTP latency overlaps with inference. A frame
+    the consumer has not picked up yet is replaced: detection always runs on
+    the freshest snapshot and never falls behind.
+    """
+    logger = logging.getLogger("ai_targhe")
+    while not _stop.is_set():
+        fetch_start = time.time()
+        try:
+            jpeg_bytes = ha.get_camera_snapshot(entity_id)
+            if jpeg_bytes is None:
+                logger.warning(
+                    "No snapshot received, retrying in %ds...", interval
+                )
+            else:
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    pass
+                frames.put(jpeg_bytes)
+        except Exception:
+            # Keep the thread alive: a dead producer would leave the main
+            # loop waiting on an empty queue forever
+            logger.exception("Snapshot fetch failed, retrying in %ds...",
+                             interval)
+        elapsed = time.time() - fetch_start
+        _stop.wait(max(0, interval - elapsed))
 
 
 def main():
@@ -47,15 +93,19 @@ def main():
 
     logger.info("=== AI Targhe Add-on Starting ===")
     logger.info("Camera: %s", config.camera_entity)
-    logger.info("Target plates: %s", config.target_plates)
+    logger.info("Target plates: %s", sorted(config.target_plates))
     logger.info("Scan interval: %ds", config.scan_interval)
     logger.info("Confidence threshold: %.2f", config.confidence_threshold)
     logger.info("Target timeout: %ds", config.target_detected_timeout)
+    logger.info("CPU threads: %d", CPU_THREADS)
 
     # 2. Initialize components
     ha = HAClient()
     recognizer = PlateRecognizer(
         confidence_threshold=config.confidence_threshold,
+        # A reused (unchanged-scene) plate keeps the binary_sensor ON: re-run
+        # YOLO at least every other scan
+        reuse_max_age=2 * config.scan_interval,
     )
 
     # 3. Initialize sensors to known state
@@ -63,69 +113,69 @@ def main():
 
     logger.info("Entering main scan loop...")
 
-    # 4. Main loop
-    while running:
-        loop_start = time.time()
-
-        # 4a. Get camera snapshot
-        jpeg_bytes = ha.get_camera_snapshot(config.camera_entity)
-        if jpeg_bytes is None:
-            logger.warning(
-                "No snapshot received, retrying in %ds...",
-                config.scan_interval,
-            )
-            time.sleep(config.scan_interval)
-            continue
-
-        # 4b. Decode JPEG to OpenCV frame
-        frame = jpeg_to_frame(jpeg_bytes)
-        if frame is None:
-            logger.error("Failed to decode JPEG snapshot")
-            time.sleep(config.scan_interval)
+    # 4. Fetch snapshots on a background thread
+    frames: queue.Queue[bytes] = queue.Queue(maxsize=1)
+    producer = threading.Thread(
+        target=_snapshot_producer,
+        args=(ha, config.camera_entity, config.scan_interval, frames),
+        name="snapshot-producer",
+        daemon=True,
+    )
+    producer.start()
+
+    # 5. Main loop: detect and report on each new snapshot
+    exit_code = 0
+    while not _stop.is_set():
+        if not producer.is_alive():
+            logger.error("Snapshot producer thread died, exiting")
+            exit_code = 1
+            break
+
+        # 5a. Wait for the next snapshot (short timeout keeps the
+        # binary_sensor timeout check running while snapshots fail)
+        try:
+            jpeg_bytes = frames.get(timeout=1.0)
+        except queue.Empty:
+            ha.check_target_timeout()
             continue
 
-        logger.debug("Snapshot OK (%d bytes, %dx%d px), running detection...", len(jpeg_bytes), frame.shape[1], frame.shape[0])
-
-        # 4c. Detect plates
-        plates = recognizer.detect(frame)
+        # 5b. Detect plates (the recognizer decodes the JPEG itself: reduced
+        # for YOLO, full resolution only when a plate region is found)
+        plates = recognizer.detect(jpeg_bytes)
 
-        # 4d. Report each detected plate to HA
+        # 5c. Report the detected plates to HA (one batched update per scan)
         if plates:
             logger.info("Scan: %d targa/e rilevata/e", len(plates))
-        for plate_info in plates:
-            plate_text = plate_info["plate"]
-            is_target = plate_text in config.target_plates
-            logger.info(
-                "Targa rilevata: %s (confidence: %.0f%%, target: %s)",
-                plate_text,
-                plate_info["confidence"] * 100,
-                "sì" if is_target else "no",
-            )
+            reports = [
+                {**p, "is_target": p["plate"] in config.target_plates}
+                for p in plates
+            ]
+            for report in reports:
+                logger.info(
+                    "Targa rilevata: %s (confidence: %.0f%%, target: %s)",
+                    report["plate"],
+                    report["confidence"] * 100,
+                    "sì" if report["is_target"] else "no",
+                )
+                if report["is_target"]:
+                    logger.info(
+                        ">>> TARGET PLATE DETECTED: %s <<<", report["plate"]
+                    )
 
-            ha.report_plate(
-                plate=plate_text,
-                confidence=plate_info["confidence"],
-                is_target=is_target,
+            ha.report_plates(
+                reports,
                 target_timeout=config.target_detected_timeout,
+                seen_at=datetime.now().isoformat(timespec="seconds"),
             )
 
-            if is_target:
-                logger.info(
-                    ">>> TARGET PLATE DETECTED: %s <<<", plate_text
-                )
-
-        # 4e. Check if binary_sensor timeout has expired
+        # 5d. Check if binary_sensor timeout has expired
         ha.check_target_timeout()
 
-        # 4f. Sleep for remaining interval (in small increments for SIGTERM)
-        elapsed = time.time() - loop_start
-        sleep_time = max(0, config.scan_interval - elapsed)
-        end_time = time.time() + sleep_time
-        while running and time.time() < end_time:
-            time.sleep(0.5)
-
+    producer.join(timeout=5)
+    ha.close()
     logger.info("=== AI Targhe Add-on Stopped ===")
+    return exit_code
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,193 +1,687 @@
-"""License plate recognition: YOLO (ONNX) + Tesseract OCR. No PyTorch."""
+"""License plate recognition: YOLO (ONNX) + Tesseract OCR. No PyTorch.
 
+YOLO runs on ONNX Runtime when the `onnxruntime` package is installed,
+otherwise on OpenCV DNN (the default on Alpine, where onnxruntime has no
+musl wheels). OCR runs in-process through `tesserocr` when available,
+otherwise through the `tesseract` CLI via pytesseract.
+"""
+
+import functools
 import logging
 import os
-import re
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import cv2
 import numpy as np
 import pytesseract
 
+from config import available_cpus, normalize_plate
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
 logger = logging.getLogger(__name__)
 
 # --- Constants ---
 INPUT_SIZE = 640
+# Letterbox padding gray (114) as a normalized blob value
+LETTERBOX_FILL = 114 / 255.0
 OCR_CONFIDENCE_THRESHOLD = 0.3
+# A valid plate read at or above this confidence stops trying further variants
+OCR_EARLY_EXIT_CONFIDENCE = 0.85
+# Plate crops shorter than this are upscaled (by an integer factor) for OCR
+OCR_TARGET_HEIGHT = 200
+# Below this crop height the upscale uses INTER_CUBIC, above INTER_LINEAR
+OCR_CUBIC_MAX_HEIGHT = 64
 OCR_ALLOWLIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-ITALIAN_PLATE_REGEX = re.compile(r"^[A-Z]{2}\d{3}[A-Z]{2}$")
+# tesseract CLI options for pytesseract: single text line, plate characters only
+_TESS_CONFIG = f"--psm 7 -c tessedit_char_whitelist={OCR_ALLOWLIST}"
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
 MODEL_ONNX = os.path.join(MODEL_DIR, "best.onnx")
+# INT8 model from scripts/export_onnx.py --int8; preferred on onnxruntime
+MODEL_ONNX_INT8 = os.path.join(MODEL_DIR, "best.int8.onnx")
+# FP16 model from scripts/export_onnx.py --fp16; preferred on onnxruntime + CUDA
+MODEL_ONNX_FP16 = os.path.join(MODEL_DIR, "best.fp16.onnx")
+# Plate box geometry (full-resolution px) worth an OCR pass; Italian plates
+# are ~4.5:1, anything outside these bounds is a spurious YOLO box
+PLATE_MIN_WIDTH = 40
+PLATE_MIN_HEIGHT = 8
+PLATE_MIN_ASPECT = 2.0
+PLATE_MAX_ASPECT = 8.0
+# IoU above which a lower-scoring YOLO box is suppressed
+NMS_IOU_THRESHOLD = 0.45
+# Max frames per YOLO forward when the model has a dynamic batch axis
+YOLO_MAX_BATCH = 8
+# Max grey-level change of any 32x32-thumbnail cell for two frames to count
+# as the same scene (JPEG/sensor noise averages out well below this)
+FRAME_CELL_MAX_DIFF = 12
+# Default seconds a detection may be reused for unchanged frames before YOLO runs again
+FRAME_REUSE_MAX_AGE = 10.0
+# Grayscale std-dev below which a frame is uniform (black/night, no activity)
+BLANK_FRAME_STD = 5.0
 
+# cv2.imdecode flag per JPEG reduction factor (libjpeg downscales in the IDCT)
+_IMREAD_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
 
-def _letterbox(img: np.ndarray, target_size: int = INPUT_SIZE) -> tuple[np.ndarray, float, float, int, int]:
-    """Letterbox resize; returns (padded_img, scale, pad_x, pad_y, orig_w, orig_h)."""
-    h, w = img.shape[:2]
-    scale = min(target_size / h, target_size / w)
-    new_w = int(round(w * scale))
-    new_h = int(round(h * scale))
-    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-    pad_x = (target_size - new_w) // 2
-    pad_y = (target_size - new_h) // 2
-    padded = np.full((target_size, target_size, 3), 114, dtype=np.uint8)
-    padded[pad_y : pad_y + new_h, pad_x : pad_x + new_w] = resized
-    return padded, scale, pad_x, pad_y, w, h
-
-
-def _xywh2xyxy(x: float, y: float, w: float, h: float) -> tuple[float, float, float, float]:
-    """Convert center (x,y) + width/height to (x1,y1,x2,y2)."""
-    x1 = x - w / 2
-    y1 = y - h / 2
-    x2 = x + w / 2
-    y2 = y + h / 2
-    return x1, y1, x2, y2
-
-
-def _recognize_plate_tesseract(frame: np.ndarray, x1: int, y1: int, x2: int, y2: int) -> tuple[str | None, float]:
-    """Run Tesseract OCR on plate region; validate Italian format. Returns (plate_text, confidence)."""
-    h_frame, w_frame = frame.shape[:2]
-    margin_x = int((x2 - x1) * 0.1)
-    margin_y = int((y2 - y1) * 0.15)
-    x1m = max(0, x1 - margin_x)
-    y1m = max(0, y1 - margin_y)
-    x2m = min(w_frame, x2 + margin_x)
-    y2m = min(h_frame, y2 + margin_y)
-
-    plate_roi = frame[y1m:y2m, x1m:x2m]
-    if plate_roi.size == 0:
-        return None, 0.0
 
-    scale = max(1, 200 // plate_roi.shape[0])
-    if scale > 1:
-        plate_roi = cv2.resize(
-            plate_roi, None, fx=scale, fy=scale,
-            interpolation=cv2.INTER_CUBIC,
+def _thumbnail(frame: np.ndarray) -> np.ndarray:
+    """32x32 grayscale thumbnail used for the cheap pre-YOLO checks."""
+    tiny = cv2.resize(frame, (32, 32), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(tiny, cv2.COLOR_BGR2GRAY)
+
+
+def _same_scene(thumb: np.ndarray, anchor: np.ndarray) -> bool:
+    """True if no thumbnail cell moved by more than FRAME_CELL_MAX_DIFF grey levels.
+
+    Absolute per-cell differences, not bits thresholded at the frame mean: a
+    dark car entering a dark part of the frame stays on the same side of the
+    mean, but its plate still changes the cells it covers.
+    """
+    return int(cv2.absdiff(thumb, anchor).max()) <= FRAME_CELL_MAX_DIFF
+
+
+def _nms_loop(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy NMS as scalar loops, for numba to compile; same result as _nms()."""
+    order = np.argsort(scores)[::-1]
+    n = order.size
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    suppressed = np.zeros(n, dtype=np.bool_)
+    keep = np.empty(n, dtype=np.int64)
+    kept = 0
+    for a in range(n):
+        if suppressed[a]:
+            continue
+        i = order[a]
+        keep[kept] = i
+        kept += 1
+        for b in range(a + 1, n):
+            if suppressed[b]:
+                continue
+            j = order[b]
+            w = min(x2[i], x2[j]) - max(x1[i], x1[j])
+            h = min(y2[i], y2[j]) - max(y1[i], y1[j])
+            if w <= 0 or h <= 0:
+                continue
+            inter = w * h
+            if inter / (areas[i] + areas[j] - inter + 1e-9) > iou_threshold:
+                suppressed[b] = True
+    return keep[:kept]
+
+
+if numba is not None:
+    # Compiled (and cached on disk) at import, with the dtypes YOLO yields,
+    # so the first detection doesn't pay for the JIT
+    _nms_jit = numba.njit(cache=True, fastmath=True)(_nms_loop)
+    _nms_jit(np.zeros((1, 4), dtype=np.float32), np.ones(1, dtype=np.float32), 0.5)
+else:
+    _nms_jit = None
+
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> list[int]:
+    """Greedy NMS on (N, 4) xyxy boxes; returns kept indices, best score first.
+
+    Runs the numba-compiled loop when numba is installed, else pure NumPy:
+    for the handful of candidates a frame yields either is cheaper than
+    converting to Python lists for cv2.dnn.NMSBoxes.
+    """
+    if _nms_jit is not None:
+        # Contiguous float32, the signature compiled at import (a strided
+        # view of the YOLO output would trigger a second compilation)
+        return _nms_jit(
+            np.ascontiguousarray(boxes, dtype=np.float32),
+            np.ascontiguousarray(scores, dtype=np.float32),
+            iou_threshold,
+        ).tolist()
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(scores)[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        inter = (
+            np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+            * np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
         )
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return keep
 
-    plate_gray = cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
-    tess_config = f"--psm 7 -c tessedit_char_whitelist={OCR_ALLOWLIST}"
 
-    preprocessed = [
-        cv2.threshold(plate_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1],
-        cv2.adaptiveThreshold(
-            plate_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2,
-        ),
-        plate_gray,
-    ]
+# OCR preprocessing strategies, built lazily from the grayscale plate ROI.
+# Insertion order is the default try order (highest yield on dark-on-white
+# Italian plates first); PlateRecognizer reorders them by how often each one
+# produced the accepted plate.
+OCR_VARIANTS = {
+    "otsu": lambda gray: cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1],
+    "gray": lambda gray: gray,
+    "adaptive": lambda gray: cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2,
+    ),
+}
 
+# CPUs granted to the add-on (cgroup quota / affinity), shared by YOLO and OCR
+CPU_THREADS = available_cpus()
+
+# Up to one worker per variant: Tesseract and OpenCV release the GIL, so the
+# variants of a plate crop are OCR'd concurrently. Never more workers than
+# CPUs: on a single core the variants run in order and the early exit skips
+# the rest.
+OCR_POOL = ThreadPoolExecutor(
+    max_workers=min(len(OCR_VARIANTS), CPU_THREADS), thread_name_prefix="ocr",
+)
+# Per-thread tesserocr API: a PyTessBaseAPI is not safe to share across threads
+_tess_local = threading.local()
+
+
+def _tess_api() -> "tesserocr.PyTessBaseAPI":
+    """The calling thread's tesserocr API, created (and its model loaded) on first use."""
+    api = getattr(_tess_local, "api", None)
+    if api is None:
+        api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_LINE)
+        api.SetVariable("tessedit_char_whitelist", OCR_ALLOWLIST)
+        _tess_local.api = api
+    return api
+
+
+def _tesserocr_words(img: np.ndarray) -> list[tuple[str, float]]:
+    """OCR through the in-process API: the language model stays loaded
+    between calls, no subprocess, temp file or TSV parsing per variant.
+    """
+    h, w = img.shape[:2]
+    img = np.ascontiguousarray(img)
+    api = _tess_api()
+    api.SetImageBytes(img.tobytes(), w, h, 1, w)
+    # SetImage* only loads the image: without Recognize() the result
+    # iterator is empty and MapWordConfidences() returns no words
+    api.Recognize()
+    return api.MapWordConfidences()
+
+
+def _pytesseract_words(img: np.ndarray) -> list[tuple[str, float]]:
+    """OCR through the tesseract CLI (one subprocess per call)."""
+    data = pytesseract.image_to_data(img, config=_TESS_CONFIG, output_type=pytesseract.Output.DICT)
+    return list(zip(data["text"], data["conf"]))
+
+
+def _is_plate(text: str) -> bool:
+    """Italian plate format AA000AA. Positional str checks: cheaper than a regex match
+    on the short strings OCR yields, and the length test rejects most garbage first.
+    """
+    return (
+        len(text) == 7 and text.isascii()
+        and text[0].isalpha() and text[1].isalpha()
+        and text[2].isdigit() and text[3].isdigit() and text[4].isdigit()
+        and text[5].isalpha() and text[6].isalpha()
+    )
+
+
+def _best_read(words: list[tuple[str, float]]) -> tuple[str | None, float]:
+    """Best valid plate in one OCR pass, from a single token or the whole line."""
     best_text = None
     best_conf = 0.0
 
-    for img in preprocessed:
-        data = pytesseract.image_to_data(img, config=tess_config, output_type=pytesseract.Output.DICT)
-        n = len(data["text"])
+    # One scan: per-token check, plus cleaned tokens and the confidence
+    # sum/count for the full line
+    parts = []
+    conf_sum = 0.0
+    conf_n = 0
+    for word, raw_conf in words:
+        # pytesseract parses conf as a number (-1 = no confidence, e.g. empty
+        # or non-word rows); older releases returned strings, hence float()
+        conf = float(raw_conf) / 100.0
+        if conf >= 0.0:
+            conf_sum += conf
+            conf_n += 1
+        else:
+            conf = 0.0
+        text = normalize_plate(word or "")
+        if not text:
+            continue
+        parts.append(text)
 
-        for i in range(n):
-            text = (data["text"][i] or "").strip().upper().replace(" ", "").replace("-", "")
-            if not text:
-                continue
-            conf = float(data["conf"][i]) / 100.0 if data["conf"][i] != "-1" else 0.0
+        if conf >= OCR_CONFIDENCE_THRESHOLD and _is_plate(text):
+            if conf > best_conf:
+                best_text = text
+                best_conf = conf
 
-            if conf >= OCR_CONFIDENCE_THRESHOLD and ITALIAN_PLATE_REGEX.match(text):
-                if conf > best_conf:
-                    best_text = text
-                    best_conf = conf
+    # Try full line. Tokens are already normalized: the translate table acts
+    # per character, so joining them equals normalizing the raw line
+    full = "".join(parts)
+    if _is_plate(full):
+        avg = conf_sum / conf_n if conf_n else 0.0
+        if avg > best_conf:
+            best_text = full
+            best_conf = avg
 
-        # Try full line
-        full = "".join((data["text"][i] or "").upper().replace(" ", "").replace("-", "") for i in range(n))
-        if full and ITALIAN_PLATE_REGEX.match(full):
-            avg = np.mean([float(data["conf"][i]) / 100.0 for i in range(n) if data["conf"][i] != "-1"] or [0])
-            if avg > best_conf:
-                best_text = full
-                best_conf = avg
+    return best_text, best_conf
 
-        if best_text:
-            return best_text, best_conf
 
-    return None, 0.0
+@functools.lru_cache(maxsize=None)
+def _load_net(model_path: str) -> cv2.dnn.Net:
+    """Load the YOLO ONNX network once per process; later PlateRecognizers reuse it."""
+    logger.info("Caricamento modello YOLO ONNX da %s", model_path)
+    net = cv2.dnn.readNetFromONNX(model_path)
+    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+    # ARMv8.2+ CPUs (e.g. Raspberry Pi 5) have native FP16 arithmetic;
+    # OpenCV falls back to FP32 by itself if the CPU lacks it.
+    if platform.machine() in ("aarch64", "arm64") and hasattr(cv2.dnn, "DNN_TARGET_CPU_FP16"):
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU_FP16)
+        logger.info("YOLO: inferenza CPU in FP16")
+    return net
+
+
+def _cuda_available() -> bool:
+    """True when the installed onnxruntime build can run on an NVIDIA GPU."""
+    return ort is not None and "CUDAExecutionProvider" in ort.get_available_providers()
+
+
+@functools.lru_cache(maxsize=None)
+def _load_session(model_path: str, use_cuda: bool = False) -> "ort.InferenceSession":
+    """Create the ONNX Runtime session once per process, with all graph fusions enabled."""
+    logger.info("Caricamento modello YOLO ONNX (onnxruntime) da %s", model_path)
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # YOLO and OCR run one after the other, so the forward may use every CPU
+    # the container is granted; ORT's default counts the host's cores instead.
+    # One sequential graph: no inter-op pool competing with the intra-op one.
+    sess_options.intra_op_num_threads = CPU_THREADS
+    sess_options.inter_op_num_threads = 1
+    sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    providers = ["CPUExecutionProvider"]
+    if use_cuda:
+        providers.insert(0, "CUDAExecutionProvider")
+    return ort.InferenceSession(model_path, sess_options, providers=providers)
+
+
+class FrameDecoder:
+    """Decodes camera JPEGs, keeping at most one snapshot's frames alive.
+
+    The reduction factor is probed on the first snapshot that decodes:
+    frames whose long side exceeds 2x target_size are decoded at half
+    resolution for YOLO. Until a probe succeeds, snapshots decode at full
+    resolution.
+    """
+
+    def __init__(self, target_size: int = INPUT_SIZE):
+        self.target_size = target_size
+        self._reduce: int | None = None
+        self._arr: np.ndarray | None = None
+        self._frame: np.ndarray | None = None
+        self._full: np.ndarray | None = None
+
+    def _probe_reduction(self) -> int | None:
+        peek = cv2.imdecode(self._arr, cv2.IMREAD_REDUCED_COLOR_8)
+        if peek is None:
+            return None
+        long_side = max(peek.shape[:2]) * 8
+        return 2 if long_side > 2 * self.target_size else 1
+
+    @property
+    def reduce(self) -> int:
+        """Reduction factor of frames returned by load()."""
+        return self._reduce or 1
+
+    def load(self, jpeg_bytes: bytes) -> np.ndarray | None:
+        """Decode a new snapshot for detection (at 1/reduce resolution)."""
+        # Release the previous frames first so the allocator can reuse their
+        # memory for this decode instead of holding two snapshots at once.
+        self._frame = None
+        self._full = None
+        self._arr = np.frombuffer(jpeg_bytes, dtype=np.uint8)  # zero-copy view
+        if self._reduce is None:
+            # A truncated/corrupt snapshot leaves it unset: probe again on
+            # the next one rather than pinning full-resolution decodes
+            self._reduce = self._probe_reduction()
+            if self._reduce is not None:
+                logger.debug("JPEG decode reduction factor: %d", self._reduce)
+        self._frame = cv2.imdecode(self._arr, _IMREAD_FLAGS[self.reduce])
+        return self._frame
+
+    @property
+    def frame(self) -> np.ndarray | None:
+        """The current snapshot as decoded by load()."""
+        return self._frame
+
+    def full_frame(self) -> np.ndarray | None:
+        """Full-resolution frame of the current snapshot, decoded at most once."""
+        if self.reduce == 1:
+            return self._frame
+        if self._full is None and self._arr is not None:
+            self._full = cv2.imdecode(self._arr, cv2.IMREAD_COLOR)
+        return self._full
 
 
 class PlateRecognizer:
-    """YOLO (ONNX via OpenCV DNN) + Tesseract OCR. No PyTorch dependency."""
+    """YOLO (ONNX via ONNX Runtime or OpenCV DNN) + Tesseract OCR. No PyTorch dependency."""
 
-    def __init__(self, confidence_threshold: float = 0.5):
+    def __init__(self, confidence_threshold: float = 0.5, reuse_max_age: float = FRAME_REUSE_MAX_AGE):
         if not os.path.exists(MODEL_ONNX):
             raise FileNotFoundError(
                 f"Modello ONNX non trovato: {MODEL_ONNX}. "
                 "Esporta il modello con: python scripts/export_onnx.py (da un ambiente con torch/ultralytics)."
             )
-        logger.info("Caricamento modello YOLO ONNX da %s", MODEL_ONNX)
-        self._net = cv2.dnn.readNetFromONNX(MODEL_ONNX)
-        logger.info("Tesseract OCR disponibile.")
+        self._io_binding: "ort.IOBinding | None" = None
+        if ort is not None:
+            # The INT8 (QDQ) model targets CPU kernels, the FP16 one the GPU's
+            # half-precision units; either falls back to the FP32 model
+            cpu_model = MODEL_ONNX_INT8 if os.path.exists(MODEL_ONNX_INT8) else MODEL_ONNX
+            if _cuda_available():
+                gpu_model = MODEL_ONNX_FP16 if os.path.exists(MODEL_ONNX_FP16) else MODEL_ONNX
+                self._sess = _load_session(gpu_model, True)
+                # A CUDA-enabled build still falls back to CPU silently when
+                # no GPU/driver is usable: don't run the FP16 model there
+                if self._sess.get_providers()[0] != "CUDAExecutionProvider":
+                    logger.warning("CUDA non disponibile a runtime, uso il modello CPU")
+                    _load_session.cache_clear()  # don't keep the unused session alive
+                    self._sess = _load_session(cpu_model, False)
+            else:
+                self._sess = _load_session(cpu_model, False)
+            model_input = self._sess.get_inputs()[0]
+            self._input_name = model_input.name
+            self._output_name = self._sess.get_outputs()[0].name
+            self._net = None
+            # Static batch (e.g. the default export): one frame per forward
+            batch_dim = model_input.shape[0]
+            self._max_batch = batch_dim if isinstance(batch_dim, int) else YOLO_MAX_BATCH
+            # Forwards run through an IOBinding, so no per-frame input/output
+            # tensors are allocated; see _bind_io()
+            self._io_binding = self._sess.io_binding()
+            self._io_device = "cpu"
+            self._io_key: tuple | None = None
+            self._io_input: "ort.OrtValue | None" = None
+            self._io_output: np.ndarray | None = None
+            self._io_output_value: "ort.OrtValue | None" = None
+            self._output_shape = self._sess.get_outputs()[0].shape
+            if self._sess.get_providers()[0] == "CUDAExecutionProvider":
+                self._io_device = "cuda"
+                logger.info("YOLO: inferenza su GPU (CUDA, IOBinding)")
+        else:
+            self._sess = None
+            self._net = _load_net(MODEL_ONNX)
+            self._max_batch = 1
+        self._use_tesserocr = tesserocr is not None
+        if self._use_tesserocr:
+            try:
+                # Loads the model in one OCR worker; the others do it on first use
+                OCR_POOL.submit(_tess_api).result()
+            except RuntimeError as e:
+                logger.warning("tesserocr non inizializzabile (%s), uso pytesseract", e)
+                self._use_tesserocr = False
+        if self._use_tesserocr:
+            logger.info("Tesseract OCR disponibile (tesserocr, in-process).")
+        else:
+            logger.info("Tesseract OCR disponibile.")
         self.confidence_threshold = confidence_threshold
+        # One decoder per batch slot: each keeps its snapshot until OCR is done
+        self._decoders: list[FrameDecoder] = [FrameDecoder()]
+        self._variant_hits: dict[str, int] = dict.fromkeys(OCR_VARIANTS, 0)
+        self._blob = np.full((1, 3, INPUT_SIZE, INPUT_SIZE), LETTERBOX_FILL, dtype=np.float32)
+        self._blob_regions: list[tuple[int, int, int, int] | None] = [None]
+        # Reused results expire after this, so a change too small for the
+        # thumbnail check (e.g. a car far away) is still caught soon after
+        self.reuse_max_age = reuse_max_age
+        self._last_thumb: np.ndarray | None = None
+        self._last_plates: list[dict] = []
+        self._last_detected_at = 0.0
 
-    def detect(self, frame: np.ndarray) -> list[dict]:
-        """Detect plates in frame. Returns list of {plate, confidence, yolo_confidence, bbox}."""
-        padded, scale, pad_x, pad_y, orig_w, orig_h = _letterbox(frame)
-        blob = cv2.dnn.blobFromImage(
-            padded, 1.0 / 255.0, (INPUT_SIZE, INPUT_SIZE), (0, 0, 0),
-            swapRB=True, crop=False,
+    def detect(self, jpeg_bytes: bytes) -> list[dict]:
+        """Detect plates in a JPEG snapshot. Returns list of {plate, confidence, yolo_confidence, bbox}.
+
+        YOLO runs on a reduced decode of large snapshots; the full-resolution
+        frame is decoded for OCR only if at least one plate region is found.
+        """
+        return self.detect_batch([jpeg_bytes])[0]
+
+    def detect_batch(self, snapshots: list[bytes]) -> list[list[dict]]:
+        """Detect plates in consecutive JPEG snapshots; returns one detect() result per snapshot.
+
+        Frames that need YOLO are stacked into one (N, 3, 640, 640) forward
+        when the model has a dynamic batch axis, else run one per forward.
+        """
+        self._ensure_slots(len(snapshots))
+        results: list[list[dict] | None] = [None] * len(snapshots)
+        thumbs: list[np.ndarray | None] = [None] * len(snapshots)
+        scheduled: list[int] = []
+        now = time.monotonic()
+        # Only a recent, non-empty detection is reused: an empty scene must be
+        # re-checked every frame, or an arriving car could go unseen
+        can_reuse = (
+            bool(self._last_plates) and self._last_thumb is not None
+            and now - self._last_detected_at < self.reuse_max_age
         )
+
+        for idx, jpeg_bytes in enumerate(snapshots):
+            frame = self._decoders[idx].load(jpeg_bytes)
+            if frame is None:
+                logger.error("Failed to decode JPEG snapshot")
+                results[idx] = []
+                continue
+            logger.debug(
+                "Snapshot OK (%d bytes, %dx%d px decoded), running detection...",
+                len(jpeg_bytes), frame.shape[1], frame.shape[0],
+            )
+
+            # Uniform frame (e.g. black night frame): nothing for YOLO to find
+            thumb = _thumbnail(frame)
+            frame_std = float(thumb.std())
+            if frame_std < BLANK_FRAME_STD:
+                logger.debug("Frame uniforme (std %.1f), YOLO saltato", frame_std)
+                results[idx] = []
+                continue
+
+            # Same scene as the last detected frame (e.g. parked car): reuse its plates
+            if can_reuse and _same_scene(thumb, self._last_thumb):
+                logger.debug("Frame unchanged, reusing last detection result")
+                results[idx] = self._last_plates
+                continue
+
+            # Frames after a changed one are compared against it only once
+            # its result is known, i.e. in the next call
+            can_reuse = False
+            thumbs[idx] = thumb
+            scheduled.append(idx)
+
+        for start in range(0, len(scheduled), self._max_batch):
+            chunk = scheduled[start : start + self._max_batch]
+            for idx, plates in zip(chunk, self._detect_frames(chunk)):
+                results[idx] = plates
+
+        if scheduled:
+            anchor = scheduled[-1]
+            self._last_thumb = thumbs[anchor]
+            self._last_plates = results[anchor]
+            self._last_detected_at = now
+        return results
+
+    def _ensure_slots(self, n: int):
+        """Grow the per-slot decoders and the NCHW blob to hold n frames."""
+        while len(self._decoders) < n:
+            self._decoders.append(FrameDecoder())
+        if self._blob.shape[0] < min(n, self._max_batch):
+            batch = min(n, self._max_batch)
+            self._blob = np.full((batch, 3, INPUT_SIZE, INPUT_SIZE), LETTERBOX_FILL, dtype=np.float32)
+            self._blob_regions = [None] * batch
+
+    def _letterbox_into_blob(self, frame: np.ndarray, slot: int = 0) -> tuple[float, int, int]:
+        """Letterbox `frame` straight into batch slot `slot` of the preallocated NCHW blob; returns (scale, pad_x, pad_y).
+
+        Resize, BGR->RGB, HWC->CHW and /255 happen in one write into the
+        blob, instead of padding a uint8 image and re-scanning it with
+        blobFromImage.
+        """
+        h, w = frame.shape[:2]
+        scale = min(INPUT_SIZE / h, INPUT_SIZE / w)
+        new_w = int(round(w * scale))
+        new_h = int(round(h * scale))
+        pad_x = (INPUT_SIZE - new_w) // 2
+        pad_y = (INPUT_SIZE - new_h) // 2
+        region = (pad_x, pad_y, new_w, new_h)
+        if region != self._blob_regions[slot]:
+            # Different geometry than the slot's previous frame: restore the padding
+            self._blob[slot].fill(LETTERBOX_FILL)
+            self._blob_regions[slot] = region
+        resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        np.multiply(
+            resized[:, :, ::-1].transpose(2, 0, 1), np.float32(1.0 / 255.0),
+            out=self._blob[slot, :, pad_y : pad_y + new_h, pad_x : pad_x + new_w],
+            dtype=np.float32,
+        )
+        return scale, pad_x, pad_y
+
+    def _forward(self, blob: np.ndarray) -> np.ndarray:
+        """Run the YOLO model on an NCHW float32 blob; returns the raw output."""
+        if self._io_binding is not None:
+            return self._forward_bound(blob)
         self._net.setInput(blob)
-        out = self._net.forward()
-        # YOLOv8: (1, 4+num_classes, 8400); 1 class -> (1, 5, 8400); oppure (1, 42000)
+        return self._net.forward()
+
+    def _bind_io(self, blob: np.ndarray):
+        """(Re)bind the forward's input and output for this blob's shape and buffer.
+
+        On CPU the input is bound to the blob's own memory and the output to
+        a preallocated array, so a forward allocates nothing. On CUDA the
+        input is a preallocated device tensor refilled in place and the output
+        stays on the device until copied back for NMS.
+        """
+        binding = self._io_binding
+        binding.clear_binding_inputs()
+        binding.clear_binding_outputs()
+        self._io_input = None
+        self._io_output = None
+        self._io_output_value = None
+        if self._io_device == "cpu":
+            binding.bind_cpu_input(self._input_name, blob)
+            out_shape = [len(blob), *self._output_shape[1:]]
+            if all(isinstance(d, int) for d in out_shape):
+                self._io_output = np.empty(out_shape, dtype=np.float32)
+                self._io_output_value = ort.OrtValue.ortvalue_from_numpy(self._io_output)
+                binding.bind_ortvalue_output(self._output_name, self._io_output_value)
+            else:
+                # Dynamic output dims (e.g. anchors): let ORT size the output
+                binding.bind_output(self._output_name, "cpu")
+        else:
+            self._io_input = ort.OrtValue.ortvalue_from_shape_and_type(
+                blob.shape, np.float32, self._io_device, 0,
+            )
+            binding.bind_ortvalue_input(self._input_name, self._io_input)
+            binding.bind_output(self._output_name, self._io_device)
+        self._io_key = (blob.shape, blob.ctypes.data)
+
+    def _forward_bound(self, blob: np.ndarray) -> np.ndarray:
+        """ORT forward through the IOBinding. On CPU the returned array is
+        reused by the next forward: consume it before running another.
+        """
+        # The blob is re-created when the batch grows: rebind on a new buffer too
+        if (blob.shape, blob.ctypes.data) != self._io_key:
+            self._bind_io(blob)
+        if self._io_input is not None:
+            self._io_input.update_inplace(blob)
+        self._sess.run_with_iobinding(self._io_binding)
+        if self._io_output is not None:
+            return self._io_output
+        return self._io_binding.copy_outputs_to_cpu()[0]
+
+    def _detect_frames(self, indices: list[int]) -> list[list[dict]]:
+        """Run one YOLO forward over the decoded frames of the given slots, then NMS + OCR per frame."""
+        geometry = [
+            self._letterbox_into_blob(self._decoders[idx].frame, slot)
+            for slot, idx in enumerate(indices)
+        ]
+        out = self._forward(self._blob[: len(indices)])
+        # YOLOv8: (N, 4+num_classes, 8400); 1 class -> (N, 5, 8400); oppure (1, 42000)
         if out.size == 42000:  # (1, 42000)
             out = out.reshape(1, 5, 8400)
         elif out.ndim == 2:
             out = out.reshape(out.shape[0], out.shape[1], -1)
-        # (1, 5, 8400) -> (8400, 5)
-        rows = out[0].T
-        boxes_xywh = []
-        scores = []
-        for row in rows:
-            *xywh, score = row
-            if score < self.confidence_threshold:
-                continue
-            boxes_xywh.append([float(x) for x in xywh])
-            scores.append(float(score))
+        return [
+            self._plates_from_output(out[slot], self._decoders[idx], *geometry[slot])
+            for slot, idx in enumerate(indices)
+        ]
 
-        if not boxes_xywh:
+    def _plates_from_output(
+        self, pred: np.ndarray, decoder: FrameDecoder, scale: float, pad_x: int, pad_y: int,
+    ) -> list[dict]:
+        """NMS + OCR on one frame's YOLO output (5, 8400)."""
+        # (5, 8400) -> (8400, 5): filter and convert in NumPy, no per-row Python
+        rows = pred.T
+        kept = rows[rows[:, 4] >= self.confidence_threshold]
+        if not len(kept):
             logger.info(
                 "Scan: YOLO non ha trovato nessuna regione targa (soglia %.2f). "
                 "Prova ad abbassare confidence_threshold o a migliorare inquadratura/illuminazione.",
                 self.confidence_threshold,
             )
             return []
+        scores = kept[:, 4]
+        centers = kept[:, :2]
+        sizes = kept[:, 2:4]
 
         # Convert to xyxy in 640x640 space
-        xyxy_640 = []
-        for xc, yc, w, h in boxes_xywh:
-            x1, y1, x2, y2 = _xywh2xyxy(xc, yc, w, h)
-            xyxy_640.append([x1, y1, x2, y2])
-
-        indices = cv2.dnn.NMSBoxes(
-            [[b[0], b[1], b[2] - b[0], b[3] - b[1]] for b in xyxy_640],
-            scores,
-            self.confidence_threshold,
-            0.45,
-        )
-        if isinstance(indices, np.ndarray):
-            indices = indices.flatten()
+        top_left = centers - sizes * 0.5
+        xyxy_640 = np.hstack([top_left, top_left + sizes])
+
+        indices = _nms(xyxy_640, scores, NMS_IOU_THRESHOLD)
+
+        # OCR needs full resolution: decode it only now that YOLO has a hit
+        reduce = decoder.reduce
+        ocr_frame = decoder.full_frame()
+        if ocr_frame is None:
+            ocr_frame, reduce = decoder.frame, 1
+        orig_h, orig_w = ocr_frame.shape[:2]
 
         plates = []
+        rejected_geometry = 0
         for i in indices:
             x1_640, y1_640, x2_640, y2_640 = xyxy_640[i]
             # Map back to original image
-            x1 = int((x1_640 - pad_x) / scale)
-            y1 = int((y1_640 - pad_y) / scale)
-            x2 = int((x2_640 - pad_x) / scale)
-            y2 = int((y2_640 - pad_y) / scale)
+            x1 = int((x1_640 - pad_x) / scale * reduce)
+            y1 = int((y1_640 - pad_y) / scale * reduce)
+            x2 = int((x2_640 - pad_x) / scale * reduce)
+            y2 = int((y2_640 - pad_y) / scale * reduce)
             x1 = max(0, min(x1, orig_w))
             y1 = max(0, min(y1, orig_h))
             x2 = max(0, min(x2, orig_w))
             y2 = max(0, min(y2, orig_h))
 
-            plate_text, ocr_conf = _recognize_plate_tesseract(frame, x1, y1, x2, y2)
+            # Too small or wrong shape for a readable plate: skip Tesseract
+            bw, bh = x2 - x1, y2 - y1
+            aspect = bw / max(bh, 1)
+            if (bw < PLATE_MIN_WIDTH or bh < PLATE_MIN_HEIGHT
+                    or not PLATE_MIN_ASPECT <= aspect <= PLATE_MAX_ASPECT):
+                rejected_geometry += 1
+                logger.debug("Regione scartata per geometria: %dx%d px (%.1f:1)", bw, bh, aspect)
+                continue
+
+            plate_text, ocr_conf = self._recognize_plate_tesseract(ocr_frame, x1, y1, x2, y2)
             if plate_text:
                 plates.append({
                     "plate": plate_text,
                     "confidence": round(ocr_conf, 3),
-                    "yolo_confidence": round(scores[i], 3),
+                    "yolo_confidence": round(float(scores[i]), 3),
                     "bbox": [x1, y1, x2, y2],
                 })
                 logger.info(
@@ -195,10 +689,97 @@ class PlateRecognizer:
                     plate_text, ocr_conf * 100, scores[i] * 100,
                 )
 
-        if boxes_xywh and not plates:
+        if not plates and rejected_geometry == len(indices):
+            logger.info(
+                "Scan: YOLO ha trovato %d regione/i targa, tutte scartate per dimensione/proporzioni "
+                "(min %dx%d px, rapporto %.0f-%.0f:1).",
+                len(indices), PLATE_MIN_WIDTH, PLATE_MIN_HEIGHT, PLATE_MIN_ASPECT, PLATE_MAX_ASPECT,
+            )
+        elif not plates:
             logger.info(
                 "Scan: YOLO ha trovato %d regione/i targa ma l'OCR non ha riconosciuto "
-                "nessuna targa valida (formato italiano AA000AA). Controlla qualità/angolazione.",
-                len(indices),
+                "nessuna targa valida (formato italiano AA000AA). Controlla qualità/angolazione. "
+                "(%d scartate per dimensione/proporzioni)",
+                len(indices), rejected_geometry,
             )
         return plates
+
+    def _recognize_plate_tesseract(self, frame: np.ndarray, x1: int, y1: int, x2: int, y2: int) -> tuple[str | None, float]:
+        """Run Tesseract OCR on plate region; validate Italian format. Returns (plate_text, confidence).
+
+        All preprocessing variants are submitted to OCR_POOL at once, most
+        successful first, and OCR'd concurrently. With as many CPUs as
+        variants they all run; a confident read only cancels variants still
+        queued, which happens when the pool has fewer workers (CPUs) than
+        variants.
+        """
+        h_frame, w_frame = frame.shape[:2]
+        margin_x = int((x2 - x1) * 0.1)
+        margin_y = int((y2 - y1) * 0.15)
+        x1m = max(0, x1 - margin_x)
+        y1m = max(0, y1 - margin_y)
+        x2m = min(w_frame, x2 + margin_x)
+        y2m = min(h_frame, y2 + margin_y)
+
+        plate_roi = frame[y1m:y2m, x1m:x2m]
+        if plate_roi.size == 0:
+            return None, 0.0
+
+        # Gray first: the upscale then interpolates one channel instead of three
+        plate_gray = cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
+
+        # Upscale small plates towards OCR_TARGET_HEIGHT by an integer factor;
+        # cubic only where it helps (tiny crops), linear otherwise
+        h0, w0 = plate_gray.shape
+        scale = OCR_TARGET_HEIGHT // h0
+        if scale > 1:
+            interp = cv2.INTER_CUBIC if h0 < OCR_CUBIC_MAX_HEIGHT else cv2.INTER_LINEAR
+            plate_gray = cv2.resize(plate_gray, (w0 * scale, h0 * scale), interpolation=interp)
+
+        return self._ocr_plate(plate_gray)
+
+    def _ocr_words(self, img: np.ndarray) -> list[tuple[str, float]]:
+        """OCR a single-line uint8 image. Returns (word, confidence 0-100) pairs, -1 = no confidence."""
+        if self._use_tesserocr:
+            return _tesserocr_words(img)
+        return _pytesseract_words(img)
+
+    def _ocr_variant(self, name: str, plate_gray: np.ndarray) -> tuple[str | None, float]:
+        """Preprocess the crop with one OCR variant and read it (runs on OCR_POOL)."""
+        return _best_read(self._ocr_words(OCR_VARIANTS[name](plate_gray)))
+
+    def _ocr_plate(self, plate_gray: np.ndarray) -> tuple[str | None, float]:
+        """Run the OCR preprocessing variants on a grayscale plate crop. Returns (plate_text, confidence).
+
+        Variants run concurrently on OCR_POOL and are scored as they finish.
+        The first valid plate read with at least OCR_EARLY_EXIT_CONFIDENCE
+        wins and cancels the variants still queued; otherwise the best read
+        across all variants wins.
+        """
+        # sorted() is stable: ties keep the default OCR_VARIANTS order.
+        # Submission order matters when the pool has fewer free workers.
+        hits = self._variant_hits
+        order = sorted(hits, key=hits.__getitem__, reverse=True)
+
+        best_text = None
+        best_conf = 0.0
+        best_variant = None
+
+        futures = {OCR_POOL.submit(self._ocr_variant, name, plate_gray): name for name in order}
+        try:
+            for future in as_completed(futures):
+                text, conf = future.result()
+                if text and conf > best_conf:
+                    best_text = text
+                    best_conf = conf
+                    best_variant = futures[future]
+                if best_conf >= OCR_EARLY_EXIT_CONFIDENCE:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+        if best_text:
+            hits[best_variant] += 1
+            return best_text, best_conf
+        return None, 0.0
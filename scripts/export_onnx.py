@@ -2,7 +2,20 @@
 """
 Esporta il modello YOLO best.pt in formato ONNX per l'addon (senza PyTorch in produzione).
 Eseguire una sola volta su un ambiente con: pip install ultralytics
+
+Opzionale, quantizzazione INT8 (richiede anche: pip install onnxruntime onnx opencv-python):
+    python scripts/export_onnx.py --int8 path/to/frames/
+dove frames/ contiene ~50 snapshot JPEG/PNG della telecamera usati per la calibrazione.
+Produce best.int8.onnx, che l'addon preferisce quando gira su onnxruntime.
+
+Con --dynamic l'asse batch è dinamico: su onnxruntime PlateRecognizer.detect_batch
+elabora più frame in una sola inferenza (con OpenCV DNN resta un frame alla volta).
+
+Con --fp16 (richiede: pip install onnx onnxconverter-common) produce anche
+best.fp16.onnx, pesi e attivazioni FP16 con input/output FP32, che l'addon usa
+quando onnxruntime gira su GPU (CUDA).
 """
+import argparse
 from pathlib import Path
 
 from ultralytics import YOLO
@@ -11,21 +24,136 @@ REPO_ROOT = Path(__file__).resolve().parent.parent
 MODELS_DIR = REPO_ROOT / "ai_targhe" / "models"
 PT_PATH = MODELS_DIR / "best.pt"
 ONNX_PATH = MODELS_DIR / "best.onnx"
+INT8_PATH = MODELS_DIR / "best.int8.onnx"
+FP16_PATH = MODELS_DIR / "best.fp16.onnx"
+INPUT_SIZE = 640
+CALIB_MAX_FRAMES = 50
+
+
+def _letterbox_blob(path: Path):
+    """Letterbox an image to INPUT_SIZE and return the NCHW float32 blob the addon feeds YOLO."""
+    import cv2
+    import numpy as np
+
+    img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = min(INPUT_SIZE / h, INPUT_SIZE / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (INPUT_SIZE - new_w) // 2, (INPUT_SIZE - new_h) // 2
+    padded = np.full((INPUT_SIZE, INPUT_SIZE, 3), 114, dtype=np.uint8)
+    padded[pad_y : pad_y + new_h, pad_x : pad_x + new_w] = resized
+    return cv2.dnn.blobFromImage(padded, 1.0 / 255.0, swapRB=True)
+
+
+def quantize_int8(onnx_path: Path, calib_dir: Path, out_path: Path):
+    """Static INT8 quantization (QDQ, per-channel) calibrated on camera frames."""
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    images = sorted(
+        p for p in calib_dir.iterdir()
+        if p.suffix.lower() in (".jpg", ".jpeg", ".png")
+    )[:CALIB_MAX_FRAMES]
+    if not images:
+        raise FileNotFoundError(f"Nessuna immagine di calibrazione in {calib_dir}")
+    input_name = ort.InferenceSession(
+        str(onnx_path), providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(images)
+
+        def get_next(self):
+            for path in self._paths:
+                blob = _letterbox_blob(path)
+                if blob is not None:
+                    return {input_name: blob}
+            return None
+
+    # The Detect head concatenates box coordinates (0-640) and class scores
+    # (0-1) into one output: a shared INT8 scale would flatten the scores.
+    # Keep the head's decode ops (DFL, reshape/concat, sigmoid) in float and
+    # quantize only its conv branches (cv2/cv3) and the backbone.
+    graph = onnx.load(str(onnx_path)).graph
+    output_node = next(n for n in graph.node if graph.output[0].name in n.output)
+    head_prefix = output_node.name.rsplit("/", 1)[0] + "/"
+    exclude = [
+        n.name for n in graph.node
+        if n.name.startswith(head_prefix) and "/cv" not in n.name
+    ]
+
+    print(f"Quantizzazione INT8 con {len(images)} frame da {calib_dir}...")
+    quantize_static(
+        str(onnx_path),
+        str(out_path),
+        FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        nodes_to_exclude=exclude,
+    )
+    print(f"Fatto: {out_path}")
+
+
+def convert_fp16(onnx_path: Path, out_path: Path):
+    """FP16 copy of the model; input and output stay float32 so the addon's blob is unchanged."""
+    import onnx
+    from onnxconverter_common import float16
+
+    model = onnx.load(str(onnx_path))
+    # Stale float32 shape/type annotations from the export would clash with
+    # the converted tensors (e.g. around Resize): let ORT re-infer them.
+    del model.graph.value_info[:]
+    print(f"Conversione FP16 di {onnx_path}...")
+    model = float16.convert_float_to_float16(model, keep_io_types=True)
+    onnx.save(model, str(out_path))
+    print(f"Fatto: {out_path}")
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--int8", metavar="CALIB_DIR", type=Path,
+        help="produce anche best.int8.onnx calibrato sulle immagini in CALIB_DIR",
+    )
+    parser.add_argument(
+        "--dynamic", action="store_true",
+        help="esporta con asse batch dinamico (inferenza a batch su onnxruntime)",
+    )
+    parser.add_argument(
+        "--fp16", action="store_true",
+        help="produce anche best.fp16.onnx (usato da onnxruntime su GPU)",
+    )
+    args = parser.parse_args()
+
     if not PT_PATH.exists():
         raise FileNotFoundError(f"Modello non trovato: {PT_PATH}")
     print(f"Caricamento {PT_PATH}...")
     model = YOLO(str(PT_PATH))
     print(f"Export ONNX in {MODELS_DIR}...")
     # ultralytics scrive best.onnx nella stessa directory del .pt
-    model.export(format="onnx", imgsz=640, simplify=True)
+    model.export(format="onnx", imgsz=640, simplify=True, dynamic=args.dynamic)
     onnx_path = PT_PATH.with_suffix(".onnx")
     if not onnx_path.exists():
         raise RuntimeError(f"Export non ha creato {onnx_path}")
     print(f"Fatto: {onnx_path}. Includilo nel repository per il build Docker.")
 
+    if args.int8:
+        quantize_int8(onnx_path, args.int8, INT8_PATH)
+    if args.fp16:
+        convert_fp16(onnx_path, FP16_PATH)
+
 
 if __name__ == "__main__":
     main()
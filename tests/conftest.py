@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The add-on modules use flat imports (from config import ...), as in the container
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ai_targhe", "app"))
@@ -0,0 +1,50 @@
+"""tesserocr (in-process) and pytesseract (CLI) must read the same words.
+
+Needs Tesseract language data: the tests skip when tesserocr cannot find
+it (set TESSDATA_PREFIX to a directory holding eng.traineddata) or, for
+the comparison, when the tesseract binary is not installed.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+import plate_recognizer as pr
+from config import normalize_plate
+
+
+def _rendered_plate(text: str = "AB123CD") -> np.ndarray:
+    """Dark-on-white single-line plate crop, grayscale, as the OCR stage sees it."""
+    img = np.full((120, 520), 235, dtype=np.uint8)
+    cv2.putText(img, text, (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 2.6, 20, 7)
+    return img
+
+
+def _words(pairs) -> list[str]:
+    return [w for w in (normalize_plate(word or "") for word, _ in pairs) if w]
+
+
+@pytest.fixture(scope="module")
+def tesserocr_api():
+    if pr.tesserocr is None:
+        pytest.skip("tesserocr not installed")
+    try:
+        return pr.OCR_POOL.submit(pr._tess_api).result()
+    except RuntimeError as e:
+        pytest.skip(f"tesserocr cannot load language data: {e}")
+
+
+def test_tesserocr_reads_plate(tesserocr_api):
+    words = pr.OCR_POOL.submit(pr._tesserocr_words, _rendered_plate()).result()
+    assert _words(words) == ["AB123CD"]
+    assert pr._best_read(words)[0] == "AB123CD"
+
+
+def test_tesserocr_matches_pytesseract(tesserocr_api):
+    try:
+        pr.pytesseract.get_tesseract_version()
+    except pr.pytesseract.TesseractNotFoundError:
+        pytest.skip("tesseract binary not installed")
+    img = _rendered_plate()
+    in_process = pr.OCR_POOL.submit(pr._tesserocr_words, img).result()
+    assert _words(in_process) == _words(pr._pytesseract_words(img))